@@ -1,4 +1,6 @@
 import streamlit as st
+import numpy as np
+import pandas as pd
 from utlis_stock_analysis import *
 
 # -----------------------------------------------------------------------------
@@ -62,6 +64,9 @@ WORLD_INDICES = {
     "Australia":"^AXJO"
 }
 
+# Reverse lookup {'^NSEI': 'Nifty 50', ...}, built once instead of on every rerun
+INDICES_BY_TICKER = {v: k for k, v in WORLD_INDICES.items()}
+
 # B. Country Configuration (Suffix & Currency)
 COUNTRY_CONFIG = {
     "India": {"suffix": ".NS", "currency": "INR"},
@@ -91,12 +96,7 @@ def render_stock_selection_ui(country, mode="multi", max_selections=5, key_suffi
         List of selected tickers (e.g., ['RELIANCE.NS'])
     """
     
-    # 1. Fetch Master Map (Ticker -> Name)
-    with st.spinner(f"Loading stock list for {country}..."):
-        stock_map = get_stock_mapping(country)
-        all_tickers = list(stock_map.keys())
-
-    # 2. Filter UI
+    # 1. Filter UI
     # We use columns to make it look compact
     c1, c2 = st.columns([1, 2])
     
@@ -107,9 +107,8 @@ def render_stock_selection_ui(country, mode="multi", max_selections=5, key_suffi
             key=f"filter_{key_suffix}"
         )
     
-    filtered_options = all_tickers
-    
-    # 3. Index Logic (If "Index" is selected)
+    # 2. Index Choice (If "Index" is selected)
+    target_index, target_ticker = None, None
     if filter_mode == "Index":
         # Dynamic Index List based on country
         indices = {k:v for k,v in WORLD_INDICES.items() if country in k}
@@ -118,11 +117,17 @@ def render_stock_selection_ui(country, mode="multi", max_selections=5, key_suffi
         with c2:
             target_index = st.selectbox("Select Index", indices.keys(), key=f"idx_{key_suffix}")
             target_ticker = indices[target_index]
-        
-        # Fetch Constituents
-        with st.spinner(f"Fetching {target_index} stocks..."):
-            index_stocks = get_index_constituents(target_ticker, country)
-            
+    
+    # 3. Fetch Master Map (Ticker -> Name) and the index constituents together
+    # Both downloads run side by side, so one spinner covers both
+    message = f"Loading stock list for {country}..." if target_ticker is None else f"Fetching {target_index} stocks..."
+    with st.spinner(message):
+        stock_map, index_stocks = get_listing_and_constituents(country, target_ticker)
+        all_tickers = list(stock_map.keys())
+    
+    filtered_options = all_tickers
+    
+    if target_ticker is not None:
         if index_stocks:
             # Intersection: Only keep stocks that are in the index
             filtered_options = [t for t in all_tickers if t in index_stocks]
@@ -150,6 +155,84 @@ def render_stock_selection_ui(country, mode="multi", max_selections=5, key_suffi
         )
         return selected
 
+@st.fragment
+def _deep_dive(target_stock, period):
+    """
+    Renders the Mode 4 dashboard (highlights, candle chart, raw data) for one stock.
+    Runs as a fragment, so interactions inside it only rerun this block, not the whole app.
+    """
+    with st.spinner(f"Analyzing {target_stock}..."):
+        df_ohlc = get_ohlc_data(target_stock, period)
+
+    if not df_ohlc.empty:
+        # ---------------------------------------------------------
+        # 1. CALCULATE METRICS
+        # ---------------------------------------------------------
+
+        # A. Current Price
+        latest = df_ohlc.iloc[-1]
+        current_price = latest['Close']
+
+        # B. Period High (Price & Date)
+        # nanargmax skips NaN like .max() did; .iat then reads the date by position
+        high = df_ohlc['High'].to_numpy()
+        hi_idx = int(np.nanargmax(high))
+        max_price = float(high[hi_idx])
+        max_price_date = df_ohlc['Date'].iat[hi_idx]
+
+        # C. Period Low (Price & Date)
+        low = df_ohlc['Low'].to_numpy()
+        lo_idx = int(np.nanargmin(low))
+        min_price = float(low[lo_idx])
+        min_price_date = df_ohlc['Date'].iat[lo_idx]
+
+        # D. Total Return (Context)
+        start_price = df_ohlc.iloc[0]['Close']
+        total_return = ((current_price / start_price) - 1) * 100
+
+        # ---------------------------------------------------------
+        # 2. DISPLAY DASHBOARD
+        # ---------------------------------------------------------
+
+        # --- ROW 1: THE BIG HIGHLIGHTS ---
+        st.subheader(f"🏷️ Price Highlights ({period})")
+
+        h1, h2, h3 = st.columns(3)
+
+        # Highlight 1: The Peak
+        h1.metric(
+            label=f"🏔️ Max Price ({max_price_date.strftime('%d %b %y')})",
+            value=f"{max_price:,.2f}",
+            delta=f"{(current_price - max_price):,.2f} from top",
+            # delta_color="inverse" # Red arrow because we are below top
+        )
+
+        # Highlight 2: Current Status
+        h2.metric(
+            label="📍 Current Price",
+            value=f"{current_price:,.2f}",
+            delta=f"{total_return:.2f}% Return"
+        )
+
+        # Highlight 3: The Bottom
+        h3.metric(
+            label=f"⚓ Min Price ({min_price_date.strftime('%d %b %y')})",
+            value=f"{min_price:,.2f}",
+            delta=f"+{(current_price - min_price):,.2f} from low"
+        )
+
+        custom_divider(height=1, margin_top=10, margin_bottom=10)
+
+        # --- ROW 2: THE CHART ---
+        st.plotly_chart(plot_candle_chart(df_ohlc, target_stock), use_container_width=True)
+
+        # --- ROW 3: RAW DATA ---
+        with st.expander("View OHLC Data"):
+            st.dataframe(df_ohlc)
+
+    else:
+        st.error("No data found for this ticker.")
+
 # -----------------------------------------------------------------------------
 # 3. SIDEBAR: GLOBAL CONTROLS
 # -----------------------------------------------------------------------------
@@ -282,8 +365,8 @@ if selected_tickers:
             name_map = {}
             
             if "1." in app_mode: # Compare Indexes
-                # Reverse the WORLD_INDICES dict: {'^NSEI': 'Nifty 50', ...}
-                name_map = {v: k for k, v in WORLD_INDICES.items()}
+                # Reversed WORLD_INDICES dict (read-only here, so no copy needed)
+                name_map = INDICES_BY_TICKER
                 
             elif "2." in app_mode: # Compare Stocks
                 # Map 'RELIANCE.NS' -> 'RELIANCE'
@@ -295,7 +378,7 @@ if selected_tickers:
             elif "3." in app_mode: # Index vs Stocks
                 # 1. Map the Benchmark
                 # Find the benchmark name from the ticker
-                bench_name = [k for k, v in WORLD_INDICES.items() if v == benchmark_ticker][0]
+                bench_name = INDICES_BY_TICKER[benchmark_ticker]
                 name_map[benchmark_ticker] = bench_name
                 
                 # 2. Map the Stocks
@@ -307,7 +390,9 @@ if selected_tickers:
             
             # A. Display the Chart
             # (Optional: Rename columns in the dataframe for the chart legend too!)
-            df_plot = df_prices.rename(columns=name_map)
+            # Shallow copy shares the price data; only the column labels are swapped (as categories)
+            df_plot = df_prices.copy(deep=False)
+            df_plot.columns = pd.CategoricalIndex([name_map.get(c, c) for c in df_prices.columns])
             st.plotly_chart(plot_performance_chart(df_plot), use_container_width=True)
             
             # B. Display "Smart Insights"
@@ -335,74 +420,7 @@ if selected_tickers:
     # 3. Mode 4: Deep Dive Analysis
     else:
         if selected_tickers:
-            target_stock = selected_tickers[0]
-            
-            with st.spinner(f"Analyzing {target_stock}..."):
-                df_ohlc = get_ohlc_data(target_stock, period)
-            
-            if not df_ohlc.empty:
-                # ---------------------------------------------------------
-                # 1. CALCULATE METRICS
-                # ---------------------------------------------------------
-                
-                # A. Current Price
-                latest = df_ohlc.iloc[-1]
-                current_price = latest['Close']
-                
-                # B. Period High (Price & Date)
-                max_price = df_ohlc['High'].max()
-                max_price_date = df_ohlc.loc[df_ohlc['High'].idxmax(), 'Date']
-                
-                # C. Period Low (Price & Date)
-                min_price = df_ohlc['Low'].min()
-                min_price_date = df_ohlc.loc[df_ohlc['Low'].idxmin(), 'Date']
-                
-                # D. Total Return (Context)
-                start_price = df_ohlc.iloc[0]['Close']
-                total_return = ((current_price / start_price) - 1) * 100
-                
-                # ---------------------------------------------------------
-                # 2. DISPLAY DASHBOARD
-                # ---------------------------------------------------------
-                
-                # --- ROW 1: THE BIG HIGHLIGHTS ---
-                st.subheader(f"🏷️ Price Highlights ({period})")
-                
-                h1, h2, h3 = st.columns(3)
-                
-                # Highlight 1: The Peak
-                h1.metric(
-                    label=f"🏔️ Max Price ({max_price_date.strftime('%d %b %y')})",
-                    value=f"{max_price:,.2f}",
-                    delta=f"{(current_price - max_price):,.2f} from top",
-                    # delta_color="inverse" # Red arrow because we are below top
-                )
-                
-                # Highlight 2: Current Status
-                h2.metric(
-                    label="📍 Current Price",
-                    value=f"{current_price:,.2f}",
-                    delta=f"{total_return:.2f}% Return"
-                )
-                
-                # Highlight 3: The Bottom
-                h3.metric(
-                    label=f"⚓ Min Price ({min_price_date.strftime('%d %b %y')})",
-                    value=f"{min_price:,.2f}",
-                    delta=f"+{(current_price - min_price):,.2f} from low"
-                )
-
-                custom_divider(height=1, margin_top=10, margin_bottom=10)
-
-                # --- ROW 2: THE CHART ---
-                st.plotly_chart(plot_candle_chart(df_ohlc, target_stock), use_container_width=True)
-                
-                # --- ROW 3: RAW DATA ---
-                with st.expander("View OHLC Data"):
-                    st.dataframe(df_ohlc)
-            
-            else:
-                st.error("No data found for this ticker.")
+            _deep_dive(selected_tickers[0], period)
 
 else:
     st.info("👆 Please select at least one asset from above options to begin.")